@@ -1,3 +1,4 @@
+import codecs
 import errno
 import queue
 import socket
@@ -10,9 +11,21 @@ import xml.etree.ElementTree as ET
 from . import log
 
 
+def set_socket_options(sock):
+    """Tune a socket accepted from the debugger for interactive use.
+
+    Commands are small and always wait for a response, so Nagle's
+    algorithm would only delay them.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
 class ConnectionHandler:
     """Handles read and write operations to a given socket."""
 
+    RECV_SIZE = 8192
+
     def __init__(self, socket, address):
         """Accept the socket used for reading and writing.
 
@@ -20,6 +33,9 @@ class ConnectionHandler:
         """
         self.sock = socket
         self.address = address
+        # bytes received but not consumed yet
+        self.__buf = bytearray()
+        self.__chunk = memoryview(bytearray(self.RECV_SIZE))
 
     def __del__(self):
         """Make sure the connection is closed."""
@@ -33,64 +49,123 @@ class ConnectionHandler:
         log.Log("Closing the socket", log.Logger.DEBUG)
         self.sock.close()
 
+    def __recv_into(self, view):
+        """Receive as many bytes as are available, up to the size of view.
+
+        Returns the number of bytes received.
+        """
+        n = self.sock.recv_into(view)
+        if n == 0:
+            self.close()
+            raise EOFError('Socket Closed')
+        return n
+
+    def __fill(self):
+        """Read whatever the socket has available into the buffer."""
+        n = self.__recv_into(self.__chunk)
+        self.__buf += self.__chunk[:n]
+
+    def __find_null(self):
+        """Get the index of the next null byte, reading until one arrives."""
+        nul = self.__buf.find(0)
+        while nul < 0:
+            # only the newly received bytes need searching
+            start = len(self.__buf)
+            self.__fill()
+            nul = self.__buf.find(0, start)
+        return nul
+
     def __recv_length(self):
         """Get the length of the proceeding message."""
-        length = []
-        while 1:
-            c = self.sock.recv(1)
-            if c == b'':
-                self.close()
-                raise EOFError('Socket Closed')
-            if c == b'\x00':
-                return int(b''.join(length))
-            if c.isdigit():
-                length.append(c)
-
-    def __recv_null(self):
-        """Receive a null byte."""
-        while 1:
-            c = self.sock.recv(1)
-            if c == b'':
-                self.close()
-                raise EOFError('Socket Closed')
-            if c == b'\x00':
-                return
+        nul = self.__find_null()
+        length = self.__buf[:nul]
+        del self.__buf[:nul + 1]
+        if not length.isdigit():
+            # ignore anything that isn't part of the number
+            length = bytes(c for c in length if c in b'0123456789')
+        return int(length)
 
     def __recv_body(self, to_recv):
-        body = []
-        while to_recv > 0:
-            buf = self.sock.recv(to_recv)
-            if buf == b'':
-                self.close()
-                raise EOFError('Socket Closed')
-            to_recv -= len(buf)
-            body.append(buf.decode("utf-8"))
-        return ''.join(body)
+        """Receive the message body and the null byte terminating it.
+
+        The body is yielded as decoded chunks, as soon as they arrive.
+        """
+        # a miscounted length can cut a character in two, which mustn't
+        # raise before the rest of the message has been dropped
+        decoder = codecs.getincrementaldecoder("utf-8")(errors='replace')
+        if self.__buf:
+            chunk = self.__buf[:to_recv]
+            del self.__buf[:to_recv]
+            to_recv -= len(chunk)
+            yield decoder.decode(chunk, to_recv == 0)
+        if to_recv > 0:
+            # read the rest straight into a buffer the size of the body, so
+            # each read takes as much as the socket has available
+            view = memoryview(bytearray(to_recv))
+            offset = 0
+            while offset < to_recv:
+                n = self.__recv_into(view[offset:])
+                yield decoder.decode(view[offset:offset + n],
+                                     offset + n == to_recv)
+                offset += n
+        nul = self.__find_null()
+        if nul:
+            # the debugger miscounted the length, e.g. in characters rather
+            # than bytes, so drop the rest of the message
+            log.Log("Skipping %i bytes after the message" % nul,
+                    log.Logger.DEBUG)
+        del self.__buf[:nul + 1]
 
     def recv_msg(self):
         """Receive a message from the debugger.
 
         Returns a string, which is expected to be XML.
         """
-        length = self.__recv_length()
-        body = self.__recv_body(length)
-        self.__recv_null()
-        return body
+        return ''.join(self.__recv_body(self.__recv_length()))
+
+    def recv_msg_parsed(self, parser):
+        """Receive a message from the debugger, parsing it as it arrives.
+
+        Returns a tuple of the root element, or None if the message
+        isn't valid XML, the message as a string, and whether the message
+        contains an error element.
+
+        parser -- an XMLPullParser which reports "end" events
+        """
+        root = None
+        has_error = False
+        body = []
+        for chunk in self.__recv_body(self.__recv_length()):
+            body.append(chunk)
+            if parser is None:
+                # invalid XML, but the rest of the message is still drained
+                continue
+            try:
+                parser.feed(chunk)
+                for _event, elem in parser.read_events():
+                    root = elem
+                    if not has_error and elem.tag.endswith('}error'):
+                        has_error = True
+            except SyntaxError:
+                parser = None
+        if parser is None:
+            return None, ''.join(body), None
+        try:
+            parser.close()
+        except SyntaxError:
+            return None, ''.join(body), None
+        for _event, elem in parser.read_events():
+            root = elem
+        return root, ''.join(body), has_error
 
     def send_msg(self, cmd):
         """Send a message to the debugger.
 
-        cmd -- command to send
+        cmd -- command to send, as a string or UTF-8 encoded bytes
         """
-        # self.sock.send(cmd + '\0')
-        MSGLEN = len(cmd)
-        totalsent = 0
-        while totalsent < MSGLEN:
-            sent = self.sock.send(bytes(cmd[totalsent:].encode()))
-            if sent == 0:
-                raise RuntimeError("socket connection broken")
-            totalsent = totalsent + sent
-        sent = self.sock.send(b'\x00')
+        if isinstance(cmd, str):
+            cmd = cmd.encode('utf-8')
+        self.sock.sendall(cmd + b'\x00')
 
 
 class SocketCreator:
@@ -151,9 +226,11 @@ class SocketCreator:
                 """Check for user interrupts"""
                 if self.input_stream is not None:
                     self.input_stream.probe()
-                return serv.accept()
+                client, address = serv.accept()
             except socket.error:
-                pass
+                continue
+            set_socket_options(client)
+            return client, address
 
     def clear(self):
         self.__sock = None
@@ -241,6 +318,7 @@ class BackgroundSocketCreator(threading.Thread):
                     client, address = await self.__socket_task
                     # set resulting socket to blocking
                     client.setblocking(True)
+                    set_socket_options(client)
 
                     self.log("Found client, %s" % str(address))
                     self.__output_q.put((client, address))
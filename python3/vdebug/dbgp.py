@@ -1,8 +1,66 @@
 import base64
-import xml.etree.ElementTree as ET
+import sys
+from binascii import a2b_base64
+
+try:
+    from lxml import etree as ET
+
+    # huge_tree lifts libxml2's depth and text size limits, which deeply
+    # nested properties and large values exceed but the standard library
+    # parser doesn't impose. Entities are left unresolved so that lifting
+    # the limits doesn't allow them to be expanded without bound.
+    _PARSER_OPTIONS = {'encoding': 'utf-8', 'huge_tree': True,
+                       'resolve_entities': False,
+                       'remove_comments': True, 'remove_pis': True}
+
+    def _parse_xml(text):
+        # lxml refuses str input that carries an encoding declaration, and
+        # the connection has already decoded the message from UTF-8.
+        parser = ET.XMLParser(**_PARSER_OPTIONS)
+        return ET.fromstring(text.encode('utf-8'), parser)
+
+    def _pull_parser():
+        return ET.XMLPullParser(events=('end',), **_PARSER_OPTIONS)
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    _parse_xml = ET.fromstring
+
+    def _pull_parser():
+        return ET.XMLPullParser(events=('end',))
 
 from . import log
 
+_NS = '{urn:debugger_protocol_v1}'
+_TAG_PROPERTY = _NS + 'property'
+_TAG_FULLNAME = _NS + 'fullname'
+_TAG_VALUE = _NS + 'value'
+_TAG_NAME = _NS + 'name'
+_TAG_ERROR = _NS + 'error'
+_TAG_MESSAGE = _NS + 'message'
+
+_STRING_TYPES = frozenset(('string', 'str', 'scalar'))
+
+# escapes a property name for use inside double quotes
+_PROPERTY_NAME_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"'})
+
+
+def _decode_base64(text):
+    """Decode base64 encoded UTF-8 text.
+
+    Returns the text unchanged if it doesn't decode to UTF-8.
+    """
+    try:
+        data = a2b_base64(text)
+    except ValueError:
+        # a2b_base64 only takes ASCII strings; skip any other characters,
+        # as it does for bytes outside the base64 alphabet
+        data = a2b_base64(text.encode('ascii', 'ignore'))
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return text
+
 
 class Response:
     """ Response objects for the DBGP module.
@@ -10,22 +68,33 @@ class Response:
     Contains response data from a command made to the debugger.
     """
 
-    ns = '{urn:debugger_protocol_v1}'
+    ns = _NS
+    ERROR_SCAN_LENGTH = 512
+    _tag_error = _TAG_ERROR
+    _tag_message = _TAG_MESSAGE
 
-    def __init__(self, response, cmd, cmd_args, api):
+    def __init__(self, response, cmd, cmd_args, api, xml=None,
+                 has_error=None):
         self.response = response
         self.cmd = cmd
         self.cmd_args = cmd_args
-        self.xml = None
+        self.xml = xml
         self.api = api
-        if "<error" in self.response:
+        if self.xml is not None:
+            self.__determine_ns()
+        if has_error is None:
+            # an error element is the first child of the root, so it always
+            # starts near the beginning of the response
+            has_error = self.response.find(
+                "<error", 0, self.ERROR_SCAN_LENGTH) != -1
+        if has_error:
             self.__parse_error()
 
     def __parse_error(self):
         """Parse an error message which has been returned
         in the response, then raise it as a DBGPError."""
         xml = self.as_xml()
-        err_el = xml.find('%serror' % self.ns)
+        err_el = xml.find(self._tag_error)
         if err_el is None:
             raise DBGPError("Could not parse error from return XML", 1)
         else:
@@ -35,7 +104,7 @@ class Response:
                                     self.response)
             elif int(code) == 4:
                 raise CmdNotImplementedError('Command not implemented')
-            msg_el = err_el.find('%smessage' % self.ns)
+            msg_el = err_el.find(self._tag_message)
             if msg_el is None:
                 raise ResponseError("Missing error message in response",
                                     self.response)
@@ -61,10 +130,15 @@ class Response:
     def as_xml(self):
         """Get the response as element tree XML.
 
-        Returns an xml.etree.ElementTree.Element object.
+        Returns an Element object, from lxml if it is installed and
+        from xml.etree.ElementTree otherwise.
+
+        Responses returned by Api.send_cmd are parsed while they are
+        received. The response string is only parsed here for responses
+        created directly from a string, or if it wasn't valid XML.
         """
         if self.xml is None:
-            self.xml = ET.fromstring(self.response)
+            self.xml = _parse_xml(self.response)
             self.__determine_ns()
         return self.xml
 
@@ -74,7 +148,11 @@ class Response:
             raise DBGPError('Invalid or missing XML namespace', 1)
         else:
             ns_parts = tag_repr.split('}')
-            self.ns = ns_parts[0] + '}'
+            ns = ns_parts[0] + '}'
+            if ns != self.ns:
+                self.ns = ns
+                self._tag_error = ns + 'error'
+                self._tag_message = ns + 'message'
 
     def __str__(self):
         return self.as_string()
@@ -116,28 +194,37 @@ class ContextGetResponse(Response):
     The property nodes are converted into ContextProperty
     objects, which are much easier to use."""
 
-    def __init__(self, response, cmd, cmd_args, api):
-        Response.__init__(self, response, cmd, cmd_args, api)
+    def __init__(self, response, cmd, cmd_args, api, xml=None,
+                 has_error=None):
+        Response.__init__(self, response, cmd, cmd_args, api, xml, has_error)
         self.properties = []
 
     def get_context(self):
-        for c in list(self.as_xml()):
-            self.create_properties(ContextProperty(c))
+        self.create_properties([ContextProperty(c) for c in self.as_xml()])
 
         return self.properties
 
-    def create_properties(self, property):
-        self.properties.append(property)
-        for p in property.children:
-            self.create_properties(p)
+    def create_properties(self, properties):
+        """Add each of the properties, followed by all of its descendants.
+
+        The tree is walked with an explicit stack rather than by
+        recursion, so deep trees don't exhaust the call stack.
+        """
+        stack = list(reversed(properties))
+        while stack:
+            prop = stack.pop()
+            self.properties.append(prop)
+            stack.extend(reversed(prop.children))
 
 
 class EvalResponse(ContextGetResponse):
     """Response object returned by the eval command."""
 
-    def __init__(self, response, cmd, cmd_args, api):
+    def __init__(self, response, cmd, cmd_args, api, xml=None,
+                 has_error=None):
         try:
-            ContextGetResponse.__init__(self, response, cmd, cmd_args, api)
+            ContextGetResponse.__init__(self, response, cmd, cmd_args, api,
+                                        xml, has_error)
         except DBGPError as e:
             if int(e.args[1]) == 206:
                 raise EvalError()
@@ -146,8 +233,8 @@ class EvalResponse(ContextGetResponse):
 
     def get_context(self):
         code = self.get_code()
-        for c in list(self.as_xml()):
-            self.create_properties(EvalProperty(c, code, self.api.language))
+        self.create_properties([EvalProperty(c, code, self.api.language)
+                                for c in self.as_xml()])
 
         return self.properties
 
@@ -157,7 +244,7 @@ class EvalResponse(ContextGetResponse):
         missing_padding = len(parts[1]) % 4
         if missing_padding != 0:
             parts[1] += '=' * (4 - missing_padding)
-        return base64.b64decode(parts[1].encode('utf-8')).decode('utf-8')
+        return a2b_base64(parts[1]).decode('utf-8')
 
 
 class BreakpointSetResponse(Response):
@@ -218,7 +305,7 @@ class Api:
 
     def __parse_init_msg(self, msg):
         """Parse the init message from the debugger"""
-        xml = ET.fromstring(msg)
+        xml = _parse_xml(msg)
         self.language = xml.get("language")
         if self.language is None:
             raise ResponseError(
@@ -243,16 +330,67 @@ class Api:
                 for certain commands (default '')
         """
         args = args.strip()
-        send = cmd.strip()
+        self.conn.send_msg(self.__build_cmd(cmd, args))
+        xml, msg, has_error = self.conn.recv_msg_parsed(_pull_parser())
+        log.Log("Response: " + msg, log.Logger.DEBUG)
+        return res_cls(msg, cmd, args, self, xml, has_error)
+
+    def send_cmd_batch(self, cmds):
+        """Send several commands to the debugger at once.
+
+        All of the commands are written before any response is read, so
+        the batch costs one network round trip rather than one for each
+        command. Responses are matched to commands by transaction ID.
+
+        Returns a list with a response object for each command, in the
+        order the commands were given. When the debugger returns an error
+        for a command, the DBGPError takes the place of its response. Any
+        other exception is raised once all the responses have been read.
+
+        cmds -- list of (cmd, args, res_cls) tuples, as taken by send_cmd
+        """
+        if not cmds:
+            return []
+        pending = {}
+        messages = []
+        for idx, (cmd, args, res_cls) in enumerate(cmds):
+            args = args.strip()
+            messages.append(self.__build_cmd(cmd, args))
+            pending[str(self.transID)] = (idx, cmd, args, res_cls)
+        # a single write lets the kernel pack the whole batch into as few
+        # segments as possible, which also covers what TCP_CORK would do
+        self.conn.send_msg(b'\0'.join(messages))
+
+        results = [None] * len(cmds)
+        failure = None
+        while pending:
+            xml, msg, has_error = self.conn.recv_msg_parsed(_pull_parser())
+            log.Log("Response: " + msg, log.Logger.DEBUG)
+            trans_id = xml.get('transaction_id') if xml is not None else None
+            if trans_id not in pending:
+                # responses come back in order, so take the oldest command
+                trans_id = next(iter(pending))
+            idx, cmd, args, res_cls = pending.pop(trans_id)
+            try:
+                results[idx] = res_cls(msg, cmd, args, self, xml, has_error)
+            except DBGPError as e:
+                results[idx] = e
+            except Exception as e:
+                if failure is None:
+                    failure = e
+        if failure is not None:
+            raise failure
+        return results
+
+    def __build_cmd(self, cmd, args):
+        """Build the encoded command, with a new transaction ID."""
         self.transID += 1
-        send += ' -i ' + str(self.transID)
+        parts = [cmd.strip(), '-i', str(self.transID)]
         if args:
-            send += ' ' + args
+            parts.append(args)
+        send = ' '.join(parts)
         log.Log("Command: " + send, log.Logger.DEBUG)
-        self.conn.send_msg(send)
-        msg = self.conn.recv_msg()
-        log.Log("Response: " + msg, log.Logger.DEBUG)
-        return res_cls(msg, cmd, args, self)
+        return send.encode('utf-8')
 
     def status(self):
         """Get the debugger status.
@@ -285,6 +423,30 @@ class Api:
         """
         return self.send_cmd('feature_set', '-n {} -v {}'.format(name, value))
 
+    def feature_get_batch(self, names):
+        """Get the values of several debugger features at once.
+
+        Returns a list with a FeatureGetResponse object, or the DBGPError
+        returned by the debugger, for each feature.
+
+        names -- list of feature names
+        """
+        return self.send_cmd_batch(
+            [('feature_get', '-n ' + str(name), FeatureGetResponse)
+             for name in names])
+
+    def feature_set_batch(self, features):
+        """Set the values of several debugger features at once.
+
+        Returns a list with a Response object, or the DBGPError returned
+        by the debugger, for each feature.
+
+        features -- list of (name, value) tuples
+        """
+        return self.send_cmd_batch(
+            [('feature_set', '-n {} -v {}'.format(name, value), Response)
+             for name, value in features])
+
     def run(self):
         """Tell the debugger to start or resume
         execution."""
@@ -354,7 +516,7 @@ class Api:
         """
         return self.send_cmd(
             'property_get',
-            '-n "%s" -d 0' % name.replace("\\", "\\\\").replace("\"", "\\\""),
+            '-n "%s" -d 0' % name.translate(_PROPERTY_NAME_ESCAPES),
             ContextGetResponse
         )
 
@@ -393,8 +555,6 @@ class Api:
 
 class ContextProperty:
 
-    ns = '{urn:debugger_protocol_v1}'
-
     def __init__(self, node, parent=None, depth=0):
         self.parent = parent
         self.__determine_type(node)
@@ -405,10 +565,10 @@ class ContextProperty:
         self.size = node.get('size')
         self.value = ""
         self.is_last_child = False
+        self._num_crs = None
 
         self._determine_children(node)
         self.__determine_value(node)
-        self.__init_children(node)
         if self.type == 'scalar':
             self.size = len(self.value) - 2
 
@@ -417,52 +577,52 @@ class ContextProperty:
             self.value = ""
             return
 
-        self.value = self._get_enc_node_text(node, 'value')
+        self.value = self._get_enc_node_text(node, _TAG_VALUE)
         if self.value is None:
             if self.encoding == 'base64':
                 if node.text is None:
                     self.value = ""
                 else:
-                    try:
-                        self.value = base64.decodebytes(
-                            node.text.encode("UTF-8")).decode("utf-8")
-                    except UnicodeDecodeError:
-                        self.value = node.text
+                    self.value = _decode_base64(node.text)
             elif not self.is_uninitialized() and not self.has_children:
                 self.value = node.text
 
         if self.value is None:
             self.value = ""
 
-        self.num_crs = self.value.count('\n')
-        if self.type.lower() in ("string", "str", "scalar"):
+        if self.type.lower() in _STRING_TYPES:
             self.value = '`%s`' % self.value.replace('`', '\\`')
 
+    @property
+    def num_crs(self):
+        """The number of line breaks in the value, counted when first
+        asked for."""
+        if self._num_crs is None:
+            self._num_crs = self.value.count('\n')
+        return self._num_crs
+
     def __determine_type(self, node):
         type = node.get('classname')
         if type is None:
             type = node.get('type')
         if type is None:
             type = 'unknown'
-        self.type = type
+        # the same few type names repeat across the whole context
+        self.type = sys.intern(type)
 
     def _determine_displayname(self, node):
         display_name = node.get('fullname')
         if display_name is None:
-            display_name = self._get_enc_node_text(node, 'fullname', "")
+            display_name = self._get_enc_node_text(node, _TAG_FULLNAME, "")
         if display_name == '::':
             display_name = self.type
         self.display_name = display_name
 
-    def _get_enc_node_text(self, node, name, default=None):
-        n = node.find('%s%s' % (self.ns, name))
+    def _get_enc_node_text(self, node, tag, default=None):
+        n = node.find(tag)
         if n is not None and n.text is not None:
             if n.get('encoding') == 'base64':
-                try:
-                    val = base64.decodebytes(n.text.encode("UTF-8")).decode(
-                        "UTF-8")
-                except UnicodeDecodeError:
-                    val = n.text
+                val = _decode_base64(n.text)
             else:
                 val = n.text
         else:
@@ -481,21 +641,35 @@ class ContextProperty:
             children = int(children)
         self.num_declared_children = children
         self.has_children = children > 0
-        self.children = []
+        # the node is kept until the children are first asked for
+        self._node = node if self.has_children else None
+        self._children = None
 
-    def __init_children(self, node):
-        if self.has_children:
-            idx = 0
-            tagname = '%sproperty' % self.ns
-            children = list(node)
-            if children is not None:
-                for c in children:
-                    if c.tag == tagname:
-                        idx += 1
-                        p = self._create_child(c, self, self.depth + 1)
-                        self.children.append(p)
-                        if idx == self.num_declared_children:
-                            p.mark_as_last_child()
+    @property
+    def children(self):
+        """The child properties, created when first asked for.
+
+        Only this level is created; each child creates its own children
+        in turn when they are asked for.
+        """
+        if self._children is None:
+            self._children = []
+            if self.has_children:
+                for c in self._child_nodes(self._node):
+                    self._add_child(c)
+                self._node = None
+        return self._children
+
+    def _child_nodes(self, node):
+        """Get the property nodes describing the children of this one."""
+        return node.findall(_TAG_PROPERTY)
+
+    def _add_child(self, node):
+        p = self._create_child(node, self, self.depth + 1)
+        self._children.append(p)
+        if len(self._children) == self.num_declared_children:
+            p.mark_as_last_child()
+        return p
 
     def _create_child(self, node, parent, depth):
         return ContextProperty(node, parent, depth)
@@ -522,42 +696,54 @@ class ContextProperty:
 
 
 class EvalProperty(ContextProperty):
+    # method names looked up once per evaluation rather than testing the
+    # language for each property
+    _DISPLAYNAME_BUILDERS = {
+        'php': '_displayname_php',
+        'perl': '_displayname_perl',
+    }
+
     def __init__(self, node, code, language, parent=None, depth=0):
         self.code = code
         self.language = language.lower()
         self.is_parent = parent is None
+        if self.is_parent:
+            self._displayname_builder = self._DISPLAYNAME_BUILDERS.get(
+                self.language, '_displayname_default')
+        else:
+            # children share the builder chosen for the top property
+            self._displayname_builder = parent._displayname_builder
         ContextProperty.__init__(self, node, parent, depth)
 
     def _create_child(self, node, parent, depth):
-        return EvalProperty(node, self.code, self.language, parent, depth)
+        return self.__class__(node, self.code, self.language, parent,
+                              depth)
 
     def _determine_displayname(self, node):
         if self.is_parent:
             self.display_name = self.code
         else:
-            if self.language == 'php':
-                if self.parent.type == 'array':
-                    if node.get('name').isdigit():
-                        self.display_name = self.parent.display_name + \
-                            "[%s]" % node.get('name')
-                    else:
-                        self.display_name = self.parent.display_name + \
-                            "['%s']" % node.get('name')
-                else:
-                    self.display_name = self.parent.display_name + \
-                        "->" + node.get('name')
-            elif self.language == 'perl':
-                self.display_name = node.get('fullname')
-            else:
-                name = node.get('name')
-                if name is None:
-                    name = "?"
-                    name = self._get_enc_node_text(node, 'name', '?')
-                if self.parent.type == 'list':
-                    self.display_name = self.parent.display_name + name
-                else:
-                    self.display_name = self.parent.display_name + \
-                        "." + name
+            self.display_name = getattr(
+                self, self._displayname_builder)(node)
+
+    def _displayname_php(self, node):
+        name = node.get('name')
+        if self.parent.type == 'array':
+            if name.isdigit():
+                return self.parent.display_name + '[' + name + ']'
+            return self.parent.display_name + "['" + name + "']"
+        return self.parent.display_name + '->' + name
+
+    def _displayname_perl(self, node):
+        return node.get('fullname')
+
+    def _displayname_default(self, node):
+        name = node.get('name')
+        if name is None:
+            name = self._get_enc_node_text(node, _TAG_NAME, '?')
+        if self.parent.type == 'list':
+            return self.parent.display_name + name
+        return self.parent.display_name + '.' + name
 
 
 # Errors/Exceptions
@@ -257,38 +257,28 @@ class Session:
             'show_hidden',  # has set
             'notify_ok',  # has set
         ]
-        for feature in must_features:
-            try:
-                feature_value = self.__api.feature_get(feature)
-                log.Log(
-                    "Must Feature: %s = %s" % (feature, str(feature_value)),
-                    log.Logger.DEBUG
-                )
-            except dbgp.DBGPError:
+        features = must_features + maybe_features
+        values = self.__api.feature_get_batch(features)
+        for idx, (feature, feature_value) in enumerate(zip(features, values)):
+            if isinstance(feature_value, dbgp.DBGPError):
                 error_str = "Failed to get feature %s" % feature
                 log.Log(error_str, log.Logger.DEBUG)
-
-        for feature in maybe_features:
-            try:
-                feature_value = self.__api.feature_get(feature)
+            else:
+                kind = "Must" if idx < len(must_features) else "Maybe"
                 log.Log(
-                    "Maybe Feature: %s = %s" % (feature, str(feature_value)),
+                    "%s Feature: %s = %s" % (kind, feature, str(feature_value)),
                     log.Logger.DEBUG
                 )
-            except dbgp.DBGPError:
-                error_str = "Failed to get feature %s" % feature
-                log.Log(error_str, log.Logger.DEBUG)
 
     def __set_default_features(self):
-        features = {
-            'multiple_sessions': 0,  # explicitly disable multiple sessions atm
-            'extended_properties': 1,
-        }
-        for name, value in features.items():
-            try:
-                self.__api.feature_set(name, value)
-            except dbgp.DBGPError as e:
-                error_str = "Failed to set feature %s: %s" % (name, e.args[0])
+        features = [
+            ('multiple_sessions', 0),  # explicitly disable multiple sessions atm
+            ('extended_properties', 1),
+        ]
+        results = self.__api.feature_set_batch(features)
+        for (name, value), res in zip(features, results):
+            if isinstance(res, dbgp.DBGPError):
+                error_str = "Failed to set feature %s: %s" % (name, res.args[0])
                 log.Log(error_str, log.Logger.DEBUG)
 
     def __set_features(self):
@@ -297,12 +287,11 @@ class Session:
         Errors are caught if the debugger doesn't like the feature name or
         value. This doesn't break the loop, so multiple features can be set
         even in the case of an error."""
-        features = vim.eval('g:vdebug_features')
-        for name, value in features.items():
-            try:
-                self.__api.feature_set(name, value)
-            except dbgp.DBGPError as e:
-                error_str = "Failed to set feature %s: %s" % (name, e.args[0])
+        features = list(vim.eval('g:vdebug_features').items())
+        results = self.__api.feature_set_batch(features)
+        for (name, value), res in zip(features, results):
+            if isinstance(res, dbgp.DBGPError):
+                error_str = "Failed to set feature %s: %s" % (name, res.args[0])
                 self.__ui.error(error_str)
 
     def __initialize_breakpoints(self):
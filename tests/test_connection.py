@@ -1,5 +1,8 @@
+import socket
+import threading
 import unittest
 import vdebug.connection
+import xml.etree.ElementTree as ET
 
 class SocketMockError():
     pass
@@ -10,43 +13,33 @@ class SocketMock():
         self.last_msg = []
 
     def recv(self,length):
+        if not self.response:
+            return b''
         ret = self.response[0]
-        if len(ret) >= length:
-            chars = ret[0:length]
-            newval = ret[length:]
-            if len(newval) > 0:
-                self.response[0] = newval
-            else:
-                self.response.pop(0)
-            if (length == 1):
-                return b"".join(chars)
-            else :
-                return b''.join(chars)
-            #if type(chars[0]) is int:
-            #    print("len same as length")
-            #    print(ret[0:length])
-            #    return b''.join([bytes(i) for i in chars])
-            #    return b"".join(chars)
-            #else:
-            #    return b"".join(chars)
+        chars = ret[0:length]
+        newval = ret[length:]
+        if len(newval) > 0:
+            self.response[0] = newval
         else:
             self.response.pop(0)
-            return b''
+        return chars
 
-    def add_response(self,res):
-        digitlist = []
-        for i in str(res):
-            digitlist.append(bytes(i, "utf8"))
-        self.response.append(digitlist)
+    def recv_into(self,buffer,nbytes=0):
+        chars = self.recv(nbytes or len(buffer))
+        buffer[0:len(chars)] = chars
+        return len(chars)
 
-        #res = bytes(res, 'utf8')
-        #self.response.append(list(res))
-        self.response.append([b'\x00'])
+    def add_response(self,res):
+        self.response.append(bytes(str(res), "utf8"))
+        self.response.append(b'\x00')
 
     def send(self,msg):
         self.last_msg.append( msg )
         return len(msg)
 
+    def sendall(self,msg):
+        self.last_msg.append( msg )
+
     def get_last_sent(self):
         last = self.last_msg
         self.last_msg = [];
@@ -89,6 +82,132 @@ class ConnectionTest(unittest.TestCase):
         response = self.conn.recv_msg()
         assert response == 'this is a longer message'
 
+    """
+    Test that a length arriving over several reads is parsed.
+    """
+    def test_read_split_length(self):
+        self.conn.sock.response.append(b'2')
+        self.conn.sock.response.append(b'4')
+        self.conn.sock.response.append(b'\x00this is a longer message\x00')
+
+        assert self.conn.recv_msg() == 'this is a longer message'
+
+    """
+    Test that several messages delivered by a single recv() are all read.
+    """
+    def test_read_buffered(self):
+        self.conn.sock.response.append(b'3\x00foo\x0024\x00this is a longer message\x00')
+
+        assert self.conn.recv_msg() == 'foo'
+        assert self.conn.recv_msg() == 'this is a longer message'
+
+    """
+    Test that a multi-byte character split across reads is decoded.
+    """
+    def test_read_split_character(self):
+        self.conn.sock.response.append(b'4\x00f\xc3')
+        self.conn.sock.response.append(b'\xa9o\x00')
+
+        assert self.conn.recv_msg() == 'f\xe9o'
+
+    """
+    Test that a large body is read in as few reads as the socket allows.
+    """
+    def test_read_large_body_in_one_read(self):
+        body = b'x' * 100000
+        self.conn.sock.response.extend([b'100000\x00', body, b'\x00'])
+        reads = []
+        recv_into = self.conn.sock.recv_into
+
+        def counting_recv_into(*args):
+            reads.append(args)
+            return recv_into(*args)
+        self.conn.sock.recv_into = counting_recv_into
+
+        assert self.conn.recv_msg() == body.decode()
+        assert len(reads) == 3
+
+    """
+    Test that a length counted in characters rather than bytes doesn't
+    break the following messages.
+    """
+    def test_read_length_in_characters(self):
+        self.conn.sock.response.append(b'3\x00f\xc3\xa9o\x00')
+        self.conn.sock.response.append(b'3\x00bar\x00')
+
+        assert self.conn.recv_msg() == 'f\xe9'
+        assert self.conn.recv_msg() == 'bar'
+
+    """
+    Test that a length which cuts a character in two doesn't break the
+    following messages.
+    """
+    def test_read_length_cutting_a_character(self):
+        self.conn.sock.response.append(b'2\x00a\xc3\xa9\x00')
+        self.conn.sock.response.append(b'3\x00bar\x00')
+
+        assert self.conn.recv_msg() == 'a\ufffd'
+        assert self.conn.recv_msg() == 'bar'
+
+        # and when the body is read separately from the length
+        self.conn.sock.response.extend([b'2\x00', b'a\xc3', b'\xa9\x00'])
+        self.conn.sock.response.append(b'3\x00baz\x00')
+
+        assert self.conn.recv_msg() == 'a\ufffd'
+        assert self.conn.recv_msg() == 'baz'
+
+    """
+    Test that anything but digits is ignored in the length.
+    """
+    def test_read_length_with_other_bytes(self):
+        self.conn.sock.response.append(b'\r\n3\x00foo\x00')
+
+        assert self.conn.recv_msg() == 'foo'
+
+    """
+    Test that recv_msg_parsed returns the parsed root and the raw message.
+    """
+    def test_read_parsed(self):
+        msg = '<response status="break"><stack level="0"/></response>'
+        self.conn.sock.add_response(len(msg))
+        self.conn.sock.add_response(msg)
+
+        root, response, has_error = self.conn.recv_msg_parsed(
+            ET.XMLPullParser(events=('end',)))
+        assert response == msg
+        assert root.tag == 'response'
+        assert root.get('status') == 'break'
+        assert has_error == False
+
+    """
+    Test that recv_msg_parsed reports an error element in the message.
+    """
+    def test_read_parsed_error(self):
+        msg = ('<response xmlns="urn:debugger_protocol_v1"><error code="5">'
+               '<message>command is not available</message></error></response>')
+        self.conn.sock.add_response(len(msg))
+        self.conn.sock.add_response(msg)
+
+        root, response, has_error = self.conn.recv_msg_parsed(
+            ET.XMLPullParser(events=('end',)))
+        assert has_error == True
+
+    """
+    Test that an invalid message is still read in full.
+    """
+    def test_read_parsed_invalid(self):
+        self.conn.sock.add_response(8)
+        self.conn.sock.add_response('<?xml...')
+        self.conn.sock.add_response(3)
+        self.conn.sock.add_response('foo')
+
+        root, response, has_error = self.conn.recv_msg_parsed(
+            ET.XMLPullParser(events=('end',)))
+        assert root is None
+        assert has_error is None
+        assert response == '<?xml...'
+        assert self.conn.recv_msg() == 'foo'
+
     """
     Test that an EOFError is raised if the socket appears to be closed.
     """
@@ -105,3 +224,50 @@ class ConnectionTest(unittest.TestCase):
         self.conn.send_msg(cmd)
         sent = self.conn.sock.get_last_sent()
         assert sent == cmd+'\0'
+
+    """
+    Test that send_msg also accepts an encoded command.
+    """
+    def test_send_bytes(self):
+        cmd = 'property_get -i 3 -n "$caf\xe9"'
+        self.conn.send_msg(cmd.encode('utf-8'))
+        sent = self.conn.sock.get_last_sent()
+        assert sent == cmd+'\0'
+
+class SocketPairConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.debugger, client = socket.socketpair()
+        self.conn = vdebug.connection.ConnectionHandler(client, '')
+
+    def tearDown(self):
+        self.debugger.close()
+        self.conn.close()
+
+    def send(self, msg):
+        body = msg.encode('utf-8')
+        self.debugger.sendall(str(len(body)).encode() + b'\x00' + body + b'\x00')
+
+    """
+    Test that a message larger than the receive buffer is read in full,
+    followed by the next one.
+    """
+    def test_read_large_messages(self):
+        large = '<response>%s</response>' % ('\xe9' * 100000)
+        thread = threading.Thread(target=lambda: [self.send(large),
+                                                  self.send('foo')])
+        thread.start()
+        assert self.conn.recv_msg() == large
+        assert self.conn.recv_msg() == 'foo'
+        thread.join()
+
+class SocketOptionsTest(unittest.TestCase):
+
+    def test_nodelay_and_keepalive_are_set(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            vdebug.connection.set_socket_options(sock)
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        finally:
+            sock.close()
@@ -26,8 +26,19 @@ class ApiTest(unittest.TestCase):
             self.c = c.return_value
             self.c.recv_msg.return_value = self.init_msg
             self.c.isconnected.return_value = 1
+            self.c.recv_msg_parsed.side_effect = self.recv_msg_parsed
             self.p = vdebug.dbgp.Api(self.c)
 
+    def recv_msg_parsed(self, parser):
+        """Parse the message the test gave to recv_msg, like the real
+        connection does as the message arrives."""
+        msg = self.c.recv_msg()
+        parser.feed(msg)
+        parser.close()
+        events = list(parser.read_events())
+        has_error = any(e.tag.endswith('}error') for _, e in events)
+        return events[-1][1], msg, has_error
+
     def test_init_msg_parsed(self):
         """Test that the init message from the debugger is
         parsed successfully"""
@@ -40,7 +51,21 @@ class ApiTest(unittest.TestCase):
         format command and adds a transaction ID"""
         self.p.conn.send_msg = MagicMock()
         self.p.status()
-        self.p.conn.send_msg.assert_called_once_with('status -i 1')
+        self.p.conn.send_msg.assert_called_once_with(b'status -i 1')
+
+    def test_property_get_escapes_name(self):
+        """Test that quotes and backslashes in a property name are escaped"""
+        self.p.conn.send_msg = MagicMock()
+        self.p.property_get('$a["b\\c"]')
+        self.p.conn.send_msg.assert_called_once_with(
+            b'property_get -i 1 -n "$a[\\"b\\\\c\\"]" -d 0')
+
+    def test_context_get_args(self):
+        """Test that the context and stack depth are sent as integers"""
+        self.p.conn.send_msg = MagicMock()
+        self.p.context_get('1', 2)
+        self.p.conn.send_msg.assert_called_once_with(
+            b'context_get -i 1 -c 1 -d 2')
 
     def test_status_retval(self):
         """Test that the status command receives a message from the api."""
@@ -153,6 +178,63 @@ class ApiTest(unittest.TestCase):
         self.assertEqual(str(res),"iso-8859-1")
         self.assertEqual(res.is_supported(),1)
 
+    def test_error_response_raises_exception(self):
+        """Test that an error returned by the debugger is raised."""
+        self.p.conn.recv_msg.return_value = """<?xml
+            version="1.0" encoding="iso-8859-1"?>\n
+            <response command="stack_get"
+                      xmlns="urn:debugger_api_v1"
+                      transaction_id="1"><error code="5"><message>
+                <![CDATA[command is not available]]></message></error>
+            </response>"""
+        re = "command is not available"
+        self.assertRaisesRegex(vdebug.dbgp.DBGPError,re,self.p.stack_get)
+
+    def feature_set_response(self, trans_id, error=False):
+        body = ('<error code="3"><message><![CDATA[invalid or missing '
+                'options]]></message></error>' if error else '')
+        return """<?xml version="1.0" encoding="iso-8859-1"?>\n<response
+            xmlns="urn:debugger_api_v1" command="feature_set"
+            transaction_id="%i" feature="max_depth" success="1">%s</response>""" \
+            % (trans_id, body)
+
+    def test_send_cmd_batch_sends_all_commands_at_once(self):
+        """Test that a batch writes every command before reading."""
+        self.p.conn.send_msg = MagicMock()
+        self.p.conn.recv_msg.side_effect = [self.feature_set_response(1),
+                                            self.feature_set_response(2)]
+        self.p.feature_set_batch([('max_depth', 2), ('max_data', 512)])
+        self.p.conn.send_msg.assert_called_once_with(
+            b'feature_set -i 1 -n max_depth -v 2\0'
+            b'feature_set -i 2 -n max_data -v 512')
+
+    def test_send_cmd_batch_matches_transaction_ids(self):
+        """Test that responses are returned in the order of the commands."""
+        self.p.conn.recv_msg.side_effect = [self.feature_set_response(2),
+                                            self.feature_set_response(1)]
+        res = self.p.send_cmd_batch([('feature_set', '-n a -v 1', vdebug.dbgp.Response),
+                                     ('feature_set', '-n b -v 2', vdebug.dbgp.Response)])
+        self.assertEqual(res[0].get_cmd_args(), '-n a -v 1')
+        self.assertEqual(res[0].as_xml().get('transaction_id'), '1')
+        self.assertEqual(res[1].get_cmd_args(), '-n b -v 2')
+        self.assertEqual(res[1].as_xml().get('transaction_id'), '2')
+
+    def test_send_cmd_batch_returns_errors(self):
+        """Test that an error in one response doesn't stop the batch."""
+        self.p.conn.recv_msg.side_effect = [self.feature_set_response(1, True),
+                                            self.feature_set_response(2)]
+        res = self.p.feature_set_batch([('max_depth', 'x'), ('max_data', 512)])
+        self.assertIsInstance(res[0], vdebug.dbgp.DBGPError)
+        self.assertEqual(res[0].args[0], 'invalid or missing options')
+        self.assertIsInstance(res[1], vdebug.dbgp.Response)
+        self.assertEqual(self.p.conn.recv_msg.call_count, 3)
+
+    def test_send_cmd_batch_empty(self):
+        """Test that an empty batch sends nothing."""
+        self.p.conn.send_msg = MagicMock()
+        self.assertEqual(self.p.send_cmd_batch([]), [])
+        self.p.conn.send_msg.assert_not_called()
+
 class apiInvalidInitTest(unittest.TestCase):
 
     init_msg = """<?xml version="1.0"
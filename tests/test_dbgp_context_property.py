@@ -70,6 +70,17 @@ encoding="base64"><![CDATA[QWxs]]></property></property></response>""")
         self.assertTrue(prop.has_children)
         self.assertEqual(prop.child_count(),4)
 
+    def test_base64_with_other_characters(self):
+        prop = self.__get_context_property(\
+            """<?xml version="1.0" encoding="utf-8"?>
+<response xmlns="urn:debugger_protocol_v1"
+command="context_get" transaction_id="3"
+context="0"><property name="$s" fullname="$s"
+type="string" size="3"
+encoding="base64"><![CDATA[QW\xe9xs]]></property></response>""")
+
+        self.assertEqual(prop.value,'`All`')
+
 class ContextPropertyAltTest(unittest.TestCase):
     def __get_context_property(self,xml_string):
         xml = ET.fromstring(xml_string)
@@ -125,3 +136,33 @@ context="0"><property  type="int" children="0" size="0"><value><![CDATA[1]]></va
         self.assertEqual(prop.type,'str')
         self.assertFalse(prop.has_children)
 
+
+class ContextPropertyLineBreaksTest(unittest.TestCase):
+    def test_num_crs(self):
+        xml = ET.fromstring("""<?xml version="1.0" encoding="iso-8859-1"?>
+<response xmlns="urn:debugger_protocol_v1" command="context_get"
+transaction_id="3" context="0"><property name="$s" fullname="$s"
+type="string" size="5" encoding="base64"><![CDATA[YQpiCmM=]]></property><property
+name="$a" fullname="$a" type="array" children="1" numchildren="0"></property></response>""")
+        prop = vdebug.dbgp.ContextProperty(xml[0])
+        self.assertEqual(prop.value, '`a\nb\nc`')
+        self.assertEqual(prop.num_crs, 2)
+        self.assertEqual(vdebug.dbgp.ContextProperty(xml[1]).num_crs, 0)
+
+class ContextPropertyLazyChildrenTest(unittest.TestCase):
+    def test_children_are_created_when_needed(self):
+        xml = ET.fromstring("""<?xml version="1.0" encoding="iso-8859-1"?>
+<response xmlns="urn:debugger_protocol_v1" command="context_get"
+transaction_id="3" context="0"><property name="$a" fullname="$a"
+type="array" children="1" numchildren="1"><property name="0"
+fullname="$a[0]" type="array" children="1" numchildren="1"><property
+name="0" fullname="$a[0][0]" type="int"><![CDATA[1]]></property></property></property></response>""")
+        prop = vdebug.dbgp.ContextProperty(xml[0])
+        self.assertIsNone(prop._children)
+
+        self.assertEqual(prop.child_count(), 1)
+        child = prop.children[0]
+        self.assertIsNone(child._children)
+        self.assertTrue(child.is_last_child)
+        self.assertEqual(child.children[0].display_name, '$a[0][0]')
+        self.assertEqual(child.children[0].depth, 2)
@@ -49,3 +49,50 @@ class EvalPropertyTest(unittest.TestCase):
         self.assertEqual(prop.display_name,'$value')
         self.assertEqual(len(prop.value),94)
         self.assertEqual(prop.type,'string')
+
+    def test_python_child_names(self):
+        prop = self.__get_eval_property(\
+            """<?xml version="1.0" encoding="utf-8"?>
+<response xmlns="urn:debugger_protocol_v1" command="eval" transaction_id="13">
+    <property type="list" children="1" numchildren="1">
+        <property name="[0]" type="Example" children="1" numchildren="1">
+            <property name="attr" type="int"><value><![CDATA[1]]></value></property>
+        </property>
+    </property>
+</response>
+""", 'mylist', 'python')
+
+        self.assertEqual(prop.children[0].display_name,'mylist[0]')
+        self.assertEqual(prop.children[0].children[0].display_name,'mylist[0].attr')
+
+    def test_perl_child_names(self):
+        prop = self.__get_eval_property(\
+            """<?xml version="1.0" encoding="utf-8"?>
+<response xmlns="urn:debugger_protocol_v1" command="eval" transaction_id="13">
+    <property type="HASH" children="1" numchildren="1">
+        <property name="key" fullname="$hash{key}" type="SCALAR"></property>
+    </property>
+</response>
+""", '$hash', 'perl')
+
+        self.assertEqual(prop.display_name,'$hash')
+        self.assertEqual(prop.children[0].display_name,'$hash{key}')
+
+    def test_subclass_displayname_override(self):
+        class UpperEvalProperty(vdebug.dbgp.EvalProperty):
+            def _displayname_default(self, node):
+                return node.get('name').upper()
+
+        xml = ET.fromstring("""<?xml version="1.0" encoding="utf-8"?>
+<response xmlns="urn:debugger_protocol_v1" command="eval" transaction_id="13">
+    <property type="dict" children="1" numchildren="1">
+        <property name="key" type="dict" children="1" numchildren="1">
+            <property name="attr" type="int"><value><![CDATA[1]]></value></property>
+        </property>
+    </property>
+</response>
+""")
+        prop = UpperEvalProperty(xml[0], 'mydict', 'python')
+
+        self.assertEqual(prop.children[0].display_name,'KEY')
+        self.assertEqual(prop.children[0].children[0].display_name,'ATTR')
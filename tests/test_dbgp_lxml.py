@@ -0,0 +1,51 @@
+import unittest
+import vdebug.dbgp
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+try:
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+
+@unittest.skipIf(lxml is None, "lxml is not installed")
+class LxmlBackendTest(unittest.TestCase):
+    """Test the lxml backend of the vdebug.dbgp module.
+
+    These only run when lxml is installed, which CI doesn't do."""
+
+    xml = """<?xml version="1.0" encoding="iso-8859-1"?>
+<!DOCTYPE response [<!ENTITY big "expanded">]>
+<response xmlns="urn:debugger_protocol_v1" command="status"
+    status="starting" reason="ok" transaction_id="1">
+<!-- a comment --><message>caf\xe9 &big;</message></response>"""
+
+    def test_uses_lxml(self):
+        """Test that lxml is used when it is installed"""
+        assert vdebug.dbgp.ET is lxml.etree
+
+    def test_parse_declared_encoding(self):
+        """Test that a decoded response with an encoding declaration
+        is parsed"""
+        res = vdebug.dbgp.Response(self.xml, "status", "", Mock())
+        xml = res.as_xml()
+        assert xml.get('status') == 'starting'
+        assert xml[0].text == "caf\xe9 "
+
+    def test_entities_not_resolved(self):
+        """Test that entities declared by the debugger aren't expanded"""
+        xml = vdebug.dbgp._parse_xml(self.xml)
+        assert "expanded" not in lxml.etree.tostring(xml).decode()
+
+    def test_pull_parser(self):
+        """Test that the pull parser handles chunked input the same way"""
+        parser = vdebug.dbgp._pull_parser()
+        for i in range(0, len(self.xml), 7):
+            parser.feed(self.xml[i:i + 7])
+        parser.close()
+        root = list(parser.read_events())[-1][1]
+        assert len(root) == 1
+        assert root[0].text == "caf\xe9 "
+        assert "expanded" not in lxml.etree.tostring(root).decode()
@@ -1,7 +1,6 @@
 import sys
 import unittest
 import vdebug.dbgp
-import xml
 try:
     from unittest.mock import Mock
 except ImportError:
@@ -40,7 +39,7 @@ class ResponseTest(unittest.TestCase):
             command="status" transaction_id="1" status="starting"
             reason="ok"></response>"""
         res = vdebug.dbgp.Response(response,"","",Mock())
-        self.assertIsInstance(res.as_xml(),xml.etree.ElementTree.Element)
+        self.assertTrue(vdebug.dbgp.ET.iselement(res.as_xml()))
 
     def test_error_tag_raises_exception(self):
         response = """<?xml version="1.0" encoding="iso-8859-1"?>
@@ -52,6 +51,23 @@ class ResponseTest(unittest.TestCase):
         re = "command is not available"
         self.assertRaisesRegex(vdebug.dbgp.DBGPError,re,vdebug.dbgp.Response,response,"","",Mock())
 
+    def test_error_text_in_value_is_not_an_error(self):
+        response = """<?xml version="1.0" encoding="iso-8859-1"?>
+            <response xmlns="urn:debugger_protocol_v1"
+            command="property_get" transaction_id="4"><property
+            name="$html" type="string"><![CDATA[%s<error>]]></property></response>""" % ("x" * 1000)
+        res = vdebug.dbgp.Response(response,"","",Mock())
+        assert res.as_string() == response
+
+    def test_error_tag_in_other_namespace_raises_exception(self):
+        response = """<?xml version="1.0" encoding="iso-8859-1"?>
+            <response xmlns="urn:debugger_api_v1"
+            command="stack_get" transaction_id="4"><error
+            code="5"><message><![CDATA[command is not available]]>
+            </message></error></response>"""
+        re = "command is not available"
+        self.assertRaisesRegex(vdebug.dbgp.DBGPError,re,vdebug.dbgp.Response,response,"","",Mock())
+
 class StatusResponseTest(unittest.TestCase):
     """Test the behaviour of the StatusResponse class."""
     def test_string_is_status_text(self):
@@ -189,6 +205,37 @@ type="uninitialized"></property></response>
         assert prop.has_children == False
         assert prop.size == "19"
 
+class ContextGetNestedTest(unittest.TestCase):
+    response = """<?xml version="1.0" encoding="iso-8859-1"?>
+<response xmlns="urn:debugger_protocol_v1" command="context_get"
+transaction_id="3" context="0"><property name="$a" fullname="$a"
+type="array" children="1" numchildren="2"><property name="0"
+fullname="$a[0]" type="array" children="1" numchildren="1"><property
+name="0" fullname="$a[0][0]" type="int"><![CDATA[1]]></property></property><property
+name="1" fullname="$a[1]" type="int"><![CDATA[2]]></property></property><property
+name="$b" fullname="$b" type="int"><![CDATA[3]]></property></response>"""
+
+    def test_properties_are_in_tree_order(self):
+        res = vdebug.dbgp.ContextGetResponse(self.response,"","",Mock())
+        context = res.get_context()
+        self.assertEqual([p.display_name for p in context],
+                         ["$a", "$a[0]", "$a[0][0]", "$a[1]", "$b"])
+        self.assertEqual([p.depth for p in context], [0, 1, 2, 1, 0])
+        self.assertEqual(context[0].children, [context[1], context[3]])
+        self.assertIs(context[2].parent, context[1])
+        self.assertTrue(context[3].is_last_child)
+        self.assertFalse(context[1].is_last_child)
+
+    def test_deep_properties(self):
+        depth = sys.getrecursionlimit() + 100
+        response = ('<response xmlns="urn:debugger_protocol_v1">' +
+            '<property type="array" numchildren="1">' * depth +
+            '</property>' * depth + '</response>')
+        res = vdebug.dbgp.ContextGetResponse(response,"","",Mock())
+        context = res.get_context()
+        self.assertEqual(len(context), depth)
+        self.assertEqual(context[-1].depth, depth - 1)
+
 class ContextGetAlternateTest(unittest.TestCase):
     response = """<?xml version="1.0" encoding="utf-8"?>
 <response xmlns="urn:debugger_protocol_v1" command="context_get" context="0" transaction_id="15"><property  pagesize="10" numchildren="3" children="1" type="list" page="0" size="3"><name encoding="base64"><![CDATA[bXlsaXN0